@@ -4,12 +4,16 @@ import json
 import time
 import sys
 import random
+import itertools
 
 # Endereço e portas do servidor
 SERVER_HOST = 'server'  
 TCP_PORT = 9000
 UDP_PORT = 9001
 
+# Gerador de ids de requisição ("rid"), ecoados pelo servidor nas respostas
+_rids = itertools.count(1)
+
 # Função para enviar mensagens em JSON pelo socket TCP
 def send_json(sock, obj):
     data = json.dumps(obj).encode('utf-8')
@@ -29,6 +33,35 @@ def recv_json(sock):
         data += part
     return json.loads(data.decode('utf-8'))
 
+# Envia vários pedidos de uma vez (cada um com seu "rid") e coleta as respostas fora de ordem
+def send_pipelined(sock, requests):
+    pending = {}
+    for req in requests:
+        rid = next(_rids)
+        pending[rid] = req
+        send_json(sock, dict(req, rid=rid))
+    replies = {}
+    while len(replies) < len(pending):
+        resp = recv_json(sock)
+        rid = resp.get("rid")
+        if rid in pending:
+            replies[rid] = resp
+        else:
+            print("[INFO]", resp)
+    return [replies[rid] for rid in pending]
+
+# Conecta ao servidor; com token, tenta retomar a sessão anterior (após reinício do servidor)
+def connect(token=None):
+    tcp = socket.create_connection((SERVER_HOST, TCP_PORT))
+    if token:
+        resp = send_pipelined(tcp, [{"cmd": "resume", "token": token}])[0]
+        if resp.get("cmd") == "resumed":
+            print("Sessão retomada como", resp["client_id"])
+            return tcp, token, resp.get("in_game", False)
+        print("Não foi possível retomar a sessão:", resp.get("reason"))
+    resp = send_pipelined(tcp, [{"cmd": "session"}])[0]
+    return tcp, resp.get("token"), False
+
 # Função de entrada do usuário com tempo limite (timeout)
 def input_with_timeout(prompt, timeout):
     if sys.platform == "win32":  # Implementação para Windows
@@ -88,30 +121,37 @@ def interactive_menu(tcp_sock, server_ip):
         print("2 - Abrir pacote")
         print("3 - Equipar skins")
         print("4 - Sair")
+        print("5 - Torneio")
         choice = input("Escolha: ").strip()
 
         # Entrar na fila de jogo
         if choice == "1":
             send_json(tcp_sock, {"cmd": "join_queue"})
             print("Entrou na fila. Aguardando adversário...")
-            game_loop(tcp_sock)
+            if game_loop(tcp_sock) is None:
+                raise ConnectionError("conexão perdida durante a partida")
 
         # Abrir pacotes de skins
         elif choice == "2":
-            print("Solicitando abrir pacote...")
-            send_json(tcp_sock, {"cmd": "open_package"})
-            resp = recv_json(tcp_sock)
-            if resp.get("cmd") == "package_opened":
-                print("Você ganhou as skins:")
-                for p in resp["awarded"]:
-                    print(" -", p["type"], ":", p["skin"])
-            else:
-                print("Resposta:", resp)
+            qtd = input("Quantos pacotes abrir? [1]: ").strip()
+            try:
+                qtd = max(1, int(qtd)) if qtd else 1
+            except ValueError:
+                print("Quantidade inválida. Abrindo 1 pacote.")
+                qtd = 1
+            print(f"Solicitando abrir {qtd} pacote(s)...")
+            for resp in send_pipelined(tcp_sock, [{"cmd": "open_package"}] * qtd):
+                if resp.get("cmd") == "package_opened":
+                    print("Você ganhou as skins:")
+                    for p in resp["awarded"]:
+                        print(" -", p["type"], ":", p["skin"])
+                else:
+                    print("Resposta:", resp)
 
-        # Equipar skins
+        # Equipar skins (com "rid": entregas de pacotes pendentes de antes de um reinício do
+        # servidor chegam sem pedido e não são confundidas com a resposta)
         elif choice == "3":
-            send_json(tcp_sock, {"cmd": "list_skins"})
-            resp = recv_json(tcp_sock)
+            resp = send_pipelined(tcp_sock, [{"cmd": "list_skins"}])[0]
             if resp.get("cmd") == "skins_list":
                 owned = resp.get("owned", [])
                 equipped = resp.get("equipped", {})
@@ -130,8 +170,7 @@ def interactive_menu(tcp_sock, server_ip):
                         continue
                     if 1 <= n <= len(owned):
                         sel = owned[n - 1]
-                        send_json(tcp_sock, {"cmd": "equip", "type": sel["type"], "skin": sel["skin"]})
-                        resp2 = recv_json(tcp_sock)
+                        resp2 = send_pipelined(tcp_sock, [{"cmd": "equip", "type": sel["type"], "skin": sel["skin"]}])[0]
                         print("Resposta do servidor:", resp2)
                     else:
                         print("Número fora do intervalo. Operação cancelada.")
@@ -146,9 +185,54 @@ def interactive_menu(tcp_sock, server_ip):
             tcp_sock.close()
             sys.exit(0)
 
+        # Torneios
+        elif choice == "5":
+            tournament_menu(tcp_sock)
+
         else:
             print("Opção inválida")
 
+# Menu de torneio: criar, inscrever-se, iniciar e jogar as partidas da chave
+def tournament_menu(tcp_sock):
+    print("\n=== TORNEIO ===")
+    print("1 - Criar torneio")
+    print("2 - Inscrever-se")
+    print("3 - Iniciar (organizador) e jogar")
+    print("4 - Aguardar e jogar minhas partidas")
+    choice = input("Escolha: ").strip()
+
+    if choice == "1":
+        fmt = input("Formato (single/swiss) [single]: ").strip() or "single"
+        resp = send_pipelined(tcp_sock, [{"cmd": "create_tournament", "format": fmt}])[0]
+        if resp.get("cmd") == "tournament_created":
+            print("Torneio criado:", resp["tid"])
+        else:
+            print("Resposta:", resp)
+    elif choice == "2":
+        tid = input("Id do torneio: ").strip()
+        resp = send_pipelined(tcp_sock, [{"cmd": "join_tournament", "tid": tid}])[0]
+        if resp.get("cmd") == "tournament_joined":
+            print(f"Inscrito em {tid} ({resp['players']} jogadores)")
+        else:
+            print("Resposta:", resp)
+    elif choice == "3":
+        tid = input("Id do torneio: ").strip()
+        # As partidas podem começar antes da confirmação chegar: tudo é tratado no loop de jogo
+        send_json(tcp_sock, {"cmd": "start_tournament", "tid": tid})
+        tournament_loop(tcp_sock)
+    elif choice == "4":
+        print("Aguardando partidas do torneio...")
+        tournament_loop(tcp_sock)
+    else:
+        print("Opção inválida")
+
+# Joga partidas em sequência até ser eliminado ou o torneio acabar
+def tournament_loop(tcp_sock):
+    while True:
+        end = game_loop(tcp_sock)
+        if end is None or end in ("tournament_eliminated", "tournament_over", "tournament_fail"):
+            break
+
 # Função principal do loop de jogo
 def game_loop(tcp_sock):
     try:
@@ -235,16 +319,49 @@ def game_loop(tcp_sock):
                 print("[GAME] adversário desconectou. Vitória.")
                 break
 
+            # Mensagens de torneio
+            elif cmd == "tournament_started":
+                print(f"[TORNEIO] {msg.get('tid')} iniciado: {msg.get('players')} jogadores, {msg.get('rounds')} rodadas")
+            elif cmd == "tournament_round":
+                print(f"[TORNEIO] rodada {msg.get('round')} concluída em {msg.get('duration')}s")
+            elif cmd == "tournament_eliminated":
+                print("[TORNEIO] você foi eliminado.")
+                return cmd
+            elif cmd == "tournament_over":
+                print("[TORNEIO] fim! Campeão:", msg.get("champion"))
+                for pos, row in enumerate(msg.get("standings", []), 1):
+                    print(f" {pos}. {row}")
+                return cmd
+            elif cmd == "tournament_fail":
+                print("[TORNEIO] falhou:", msg.get("reason"))
+                return cmd
+
             # Mensagens genéricas
             else:
                 print("[INFO]", msg)
 
+        return "game_over"
+
     except Exception as e:
         print("[GAME] conexão perdida:", e)
 
-# Função principal do cliente
+# Função principal do cliente: se a conexão cair (ex.: reinício do servidor), reconecta e retoma a sessão
 if __name__ == "__main__":
-    tcp = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    tcp.connect((SERVER_HOST, TCP_PORT))
-    print("Conectado ao servidor TCP", SERVER_HOST, TCP_PORT)
-    interactive_menu(tcp, SERVER_HOST)
+    token = None
+    while True:
+        try:
+            tcp, token, in_game = connect(token)
+        except OSError as e:
+            print("Servidor indisponível, tentando novamente...", e)
+            time.sleep(1)
+            continue
+        print("Conectado ao servidor TCP", SERVER_HOST, TCP_PORT)
+        try:
+            if in_game:
+                print("Retomando partida em andamento...")
+                game_loop(tcp)
+            interactive_menu(tcp, SERVER_HOST)
+        except (ConnectionError, OSError) as e:
+            print("[CONEXÃO] perdida, reconectando:", e)
+            tcp.close()
+            time.sleep(1)
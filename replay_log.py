@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+import os
+import socket
+import struct
+import threading
+import time
+from queue import Queue, Empty
+
+# Diretório e tamanho dos segmentos do log de partidas
+REPLAY_DIR = os.environ.get("RPS_REPLAY_DIR", "replays")
+SEGMENT_RECORDS = 1 << 20              # registros por segmento antes de rotacionar
+FLUSH_INTERVAL = 0.5                   # intervalo máximo (s) entre flushes
+BATCH_RECORDS = 4096                   # registros gravados de uma vez no máximo
+
+# Todo registro tem tamanho fixo; o leitor navega por deslocamento (i * RECORD_SIZE)
+RECORD_SIZE = 40
+
+# Tipos de registro
+KIND_START = 1
+KIND_TURN = 2
+KIND_END = 3
+
+# Codificação compacta das cartas e dos resultados
+CARD_TYPES = ("Pedra", "Papel", "Tesoura")
+CARD_CODE = {t: i for i, t in enumerate(CARD_TYPES)}
+WINNER_NONE, WINNER_A, WINNER_B = 0, 1, 2
+FALLBACK_A, FALLBACK_B = 1, 2          # bits em "flags" dos registros de turno
+
+# Motivos de encerramento da partida
+REASON_NORMAL = 0
+REASON_TIMEOUT_A = 1
+REASON_TIMEOUT_B = 2
+REASON_BAD_PAYLOAD = 3
+REASON_DISCONNECT_A = 4                # socket do jogador caiu no meio da partida
+REASON_DISCONNECT_B = 5
+
+# Prefixo comum: tipo, flags, turno, id da partida
+#   START: semente do RNG, timestamp, ip/porta dos jogadores A e B
+#   TURN:  flags = bits de fallback; cartas, vencedor e vidas após o turno
+#   END:   flags = vencedor, turno = turnos jogados; motivo e timestamp
+PREFIX = struct.Struct('<BBHQ')
+START = struct.Struct('<BBHQQd4sH4sH')
+TURN = struct.Struct('<BBHQBBBBB23x')
+END = struct.Struct('<BBHQBd19x')
+for _st in (START, TURN, END):
+    assert _st.size == RECORD_SIZE
+del _st
+
+_pending = Queue()                     # registros já empacotados aguardando gravação
+_match_lock = threading.Lock()
+_match_seq = 0
+_boot = int(time.time()) & 0xFFFFFFFF
+
+# Gera um id de partida único entre reinícios do servidor (época de boot + contador)
+def new_match_id():
+    global _match_seq
+    with _match_lock:
+        _match_seq += 1
+        return (_boot << 32) | (_match_seq & 0xFFFFFFFF)
+
+# Converte "ip:porta" para (ip em 4 bytes, porta); ignora o sufixo "#..." que o servidor
+# acrescenta quando o endereço coincide com o de uma sessão restaurada
+def _pack_addr(client_id):
+    host, port = client_id.split('#', 1)[0].rsplit(':', 1)
+    try:
+        return socket.inet_aton(host), int(port)
+    except (OSError, ValueError):
+        return b'\0\0\0\0', 0
+
+# Converte de volta para "ip:porta"
+def unpack_addr(ip, port):
+    return f"{socket.inet_ntoa(ip)}:{port}"
+
+# Registra o início da partida com a semente usada no RNG da partida
+def record_start(match_id, seed, cli_a, cli_b):
+    ip_a, port_a = _pack_addr(cli_a)
+    ip_b, port_b = _pack_addr(cli_b)
+    _pending.put(START.pack(KIND_START, 0, 0, match_id, seed, time.time(),
+                            ip_a, port_a, ip_b, port_b))
+
+# Registra as jogadas resolvidas de um turno e o resultado
+def record_turn(match_id, turn, type_a, type_b, fallback_a, fallback_b, winner, lives_a, lives_b):
+    flags = (FALLBACK_A if fallback_a else 0) | (FALLBACK_B if fallback_b else 0)
+    code = WINNER_A if winner == 'A' else (WINNER_B if winner == 'B' else WINNER_NONE)
+    _pending.put(TURN.pack(KIND_TURN, flags, turn & 0xFFFF, match_id,
+                           CARD_CODE[type_a], CARD_CODE[type_b], code,
+                           max(lives_a, 0), max(lives_b, 0)))
+
+# Registra o fim da partida
+def record_end(match_id, turns, winner, reason):
+    code = WINNER_A if winner == 'A' else (WINNER_B if winner == 'B' else WINNER_NONE)
+    _pending.put(END.pack(KIND_END, code, turns & 0xFFFF, match_id, reason, time.time()))
+
+# Nome do arquivo de um segmento
+def segment_path(seq, directory=None):
+    return os.path.join(directory or REPLAY_DIR, f"replay-{seq:08d}.seg")
+
+# Lista os segmentos existentes em ordem
+def list_segments(directory=None):
+    directory = directory or REPLAY_DIR
+    try:
+        names = sorted(n for n in os.listdir(directory)
+                       if n.startswith("replay-") and n.endswith(".seg"))
+    except FileNotFoundError:
+        return []
+    return [os.path.join(directory, n) for n in names]
+
+# Abre o último segmento para anexar, descartando um registro parcial no final
+def _open_tail():
+    os.makedirs(REPLAY_DIR, exist_ok=True)
+    segs = list_segments()
+    seq = int(os.path.basename(segs[-1])[7:15]) if segs else 0
+    path = segment_path(seq)
+    f = open(path, 'ab')
+    size = f.tell()
+    if size % RECORD_SIZE:
+        f.truncate(size - size % RECORD_SIZE)
+        f.seek(0, os.SEEK_END)
+    return f, seq, f.tell() // RECORD_SIZE
+
+_out = {"file": None, "seq": 0, "count": 0}   # segmento aberto, usado só pela thread gravadora
+
+# Grava um lote no segmento atual, rotacionando quando ele enche
+def _write_batch(batch):
+    while batch:
+        room = SEGMENT_RECORDS - _out["count"]
+        if room <= 0:
+            _out["file"].close()
+            _out["seq"] += 1
+            _out["file"] = open(segment_path(_out["seq"]), 'ab')
+            _out["count"] = 0
+            room = SEGMENT_RECORDS
+        chunk = batch[:room]
+        batch = batch[room:]
+        _out["file"].write(b''.join(chunk))
+        _out["count"] += len(chunk)
+
+# Pede à thread gravadora que grave e faça flush de tudo que já está na fila e espera a confirmação
+# (usado no desligamento do servidor). O pedido entra na própria fila, então os registros saem
+# na ordem em que foram enfileirados; devolve False se a gravadora não confirmar a tempo
+def flush_pending(timeout=5.0):
+    if _out["file"] is None:
+        return False
+    done = threading.Event()
+    _pending.put(done)
+    return done.wait(timeout)
+
+# Thread gravadora: agrupa registros da fila e grava em lote, fora do caminho do jogo
+def replay_writer():
+    _out["file"], _out["seq"], _out["count"] = _open_tail()
+    print(f"[REPLAY] writing to {_out['file'].name} ({_out['count']} records)")
+    last_flush = time.time()
+    dirty = False
+    while True:
+        try:
+            batch = [_pending.get(timeout=FLUSH_INTERVAL)]
+        except Empty:
+            batch = []
+        # O lote para num pedido de flush_pending: tudo antes dele é gravado e confirmado
+        while batch and len(batch) < BATCH_RECORDS and not isinstance(batch[-1], threading.Event):
+            try:
+                batch.append(_pending.get_nowait())
+            except Empty:
+                break
+        waiter = batch.pop() if batch and isinstance(batch[-1], threading.Event) else None
+        if batch:
+            _write_batch(batch)
+            dirty = True
+        now = time.time()
+        if dirty and (waiter or now - last_flush >= FLUSH_INTERVAL):
+            try:
+                _out["file"].flush()
+            except Exception as e:
+                print("[REPLAY] flush failed", e)
+            dirty = False
+            last_flush = now
+        if waiter:
+            waiter.set()
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+import mmap
+import random
+import struct
+import sys
+from collections import Counter
+
+import replay_log
+from replay_log import RECORD_SIZE, KIND_START, KIND_TURN, KIND_END, START, TURN, END
+
+# Abre um segmento via mmap (somente leitura); ignora arquivos vazios
+def map_segment(path):
+    with open(path, 'rb') as f:
+        try:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return None
+
+# Percorre os segmentos mapeados, entregando (mmap, nº de registros completos)
+def iter_segments(directory=None):
+    for path in replay_log.list_segments(directory):
+        mm = map_segment(path)
+        if mm is None:
+            continue
+        try:
+            yield mm, len(mm) // RECORD_SIZE
+        finally:
+            mm.close()
+
+# Busca todos os registros de uma partida (o id fica no deslocamento 4 de cada registro)
+def find_match(match_id, directory=None):
+    needle = struct.pack('<Q', match_id)
+    records = []
+    for mm, n in iter_segments(directory):
+        limit = n * RECORD_SIZE
+        pos = mm.find(needle, 4)
+        while 0 <= pos < limit:
+            if (pos - 4) % RECORD_SIZE == 0:
+                off = pos - 4
+                records.append(mm[off:off + RECORD_SIZE])
+            pos = mm.find(needle, pos + 1)
+    return records
+
+# Reconstrói a partida a partir da semente e confere cada turno registrado
+def replay(match_id, directory=None):
+    records = find_match(match_id, directory)
+    start = [r for r in records if r[0] == KIND_START]
+    if not start:
+        print(f"partida {match_id} não encontrada")
+        return False
+    _, _, _, _, seed, ts, ip_a, port_a, ip_b, port_b = START.unpack(start[0])
+    cli_a = replay_log.unpack_addr(ip_a, port_a)
+    cli_b = replay_log.unpack_addr(ip_b, port_b)
+    print(f"[REPLAY] partida {match_id}: {cli_a} vs {cli_b} (seed={seed}, ts={ts:.3f})")
+
+    # Mesma sequência de sorteios do game_session no servidor
+    rng = random.Random(seed)
+
+    def make_deck():
+        deck = [rng.choice(["Pedra","Papel","Tesoura"]) for _ in range(10)]
+        rng.shuffle(deck)
+        return deck
+
+    def take_card(hand, card_type, fallback):
+        if not fallback:
+            hand.remove(card_type)
+            return card_type
+        if hand:
+            return hand.pop(rng.randrange(len(hand)))
+        return rng.choice(["Pedra","Papel","Tesoura"])
+
+    deck_a = make_deck(); deck_b = make_deck()
+    hand_a = [deck_a.pop() for _ in range(min(3, len(deck_a)))]
+    hand_b = [deck_b.pop() for _ in range(min(3, len(deck_b)))]
+    lives_a = 3; lives_b = 3
+    ok = True
+
+    for rec in records:
+        kind = rec[0]
+        if kind == KIND_TURN:
+            _, flags, turn, _, ca, cb, win, la, lb = TURN.unpack(rec)
+            type_a = replay_log.CARD_TYPES[ca]; type_b = replay_log.CARD_TYPES[cb]
+            fb_a = bool(flags & replay_log.FALLBACK_A); fb_b = bool(flags & replay_log.FALLBACK_B)
+            hand_before = (list(hand_a), list(hand_b))
+            try:
+                got_a = take_card(hand_a, type_a, fb_a)
+                got_b = take_card(hand_b, type_b, fb_b)
+            except ValueError:
+                got_a = got_b = None
+            if type_a != type_b:
+                if (type_a, type_b) in (("Pedra","Tesoura"), ("Tesoura","Papel"), ("Papel","Pedra")):
+                    lives_b -= 1
+                else:
+                    lives_a -= 1
+            match = (got_a == type_a and got_b == type_b
+                     and max(lives_a, 0) == la and max(lives_b, 0) == lb)
+            ok = ok and match
+            mark = "" if match else "  <-- DIVERGÊNCIA"
+            print(f" turno {turn}: A={type_a}{'*' if fb_a else ''} mão={hand_before[0]} | "
+                  f"B={type_b}{'*' if fb_b else ''} mão={hand_before[1]} -> "
+                  f"vencedor={'-AB'[win]} vidas {la}x{lb}{mark}")
+            if deck_a:
+                hand_a.append(deck_a.pop())
+            if deck_b:
+                hand_b.append(deck_b.pop())
+        elif kind == KIND_END:
+            _, win, turns, _, reason, ts_end = END.unpack(rec)
+            result = "tie" if win == replay_log.WINNER_NONE else ("A_wins" if win == replay_log.WINNER_A else "B_wins")
+            print(f"[REPLAY] fim após {turns} turnos -> {result} (motivo={reason}, duração={ts_end - ts:.1f}s)")
+    print("[REPLAY] replay consistente" if ok else "[REPLAY] replay divergente")
+    return ok
+
+# Estatísticas agregadas lendo apenas colunas dos registros (fatias com passo de memoryview)
+def stats(directory=None):
+    kinds_flags = Counter()
+    for mm, n in iter_segments(directory):
+        end = n * RECORD_SIZE
+        with memoryview(mm) as mv:
+            kinds = bytes(mv[0:end:RECORD_SIZE])
+            flags = bytes(mv[1:end:RECORD_SIZE])
+        kinds_flags.update(zip(kinds, flags))
+
+    matches = sum(c for (k, _), c in kinds_flags.items() if k == KIND_START)
+    turns = sum(c for (k, _), c in kinds_flags.items() if k == KIND_TURN)
+    fallbacks = sum(c * bin(f).count("1") for (k, f), c in kinds_flags.items() if k == KIND_TURN)
+    ended = {w: kinds_flags[(KIND_END, w)] for w in (replay_log.WINNER_NONE, replay_log.WINNER_A, replay_log.WINNER_B)}
+    print(f"Partidas iniciadas: {matches}")
+    print(f"Partidas finalizadas: {sum(ended.values())}")
+    print(f"  empates: {ended[replay_log.WINNER_NONE]}")
+    print(f"  vitórias de A: {ended[replay_log.WINNER_A]}")
+    print(f"  vitórias de B: {ended[replay_log.WINNER_B]}")
+    print(f"Turnos jogados: {turns}")
+    print(f"Jogadas com fallback aleatório: {fallbacks}")
+    return kinds_flags
+
+# Lista as partidas registradas (id, jogadores, horário)
+def list_matches(directory=None):
+    for mm, n in iter_segments(directory):
+        for i in range(n):
+            off = i * RECORD_SIZE
+            if mm[off] == KIND_START:
+                _, _, _, match_id, _, ts, ip_a, port_a, ip_b, port_b = START.unpack_from(mm, off)
+                print(match_id, replay_log.unpack_addr(ip_a, port_a), replay_log.unpack_addr(ip_b, port_b), f"{ts:.3f}")
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] == "stats":
+        stats()
+    elif len(sys.argv) >= 2 and sys.argv[1] == "list":
+        list_matches()
+    elif len(sys.argv) >= 3 and sys.argv[1] == "replay":
+        sys.exit(0 if replay(int(sys.argv[2])) else 1)
+    else:
+        print("uso: python replay_reader.py stats | list | replay <match_id>")
+        sys.exit(2)
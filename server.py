@@ -1,12 +1,21 @@
 #!/usr/bin/env python3
+import os
 import socket
 import threading
+import weakref
 import json
 import random
 import time
-from collections import deque
+import pickle
+import secrets
+import signal
+import sys
+from collections import deque, Counter
 from queue import Queue, Empty
 
+import replay_log
+import tournament
+
 # Endereço e portas do servidor
 HOST = '0.0.0.0'
 TCP_PORT = 9000
@@ -34,15 +43,43 @@ match_lock = threading.Lock()
 
 package_queue = deque()                # fila de pedidos de pacotes (client_id, evento)
 package_lock = threading.Lock()
-PACKAGE_STOCK = 20                     # estoque máximo de pacotes disponíveis
+PACKAGE_STOCK = int(os.environ.get("RPS_PACKAGE_STOCK", 20))   # estoque máximo de pacotes disponíveis
 
 clients_lock = threading.Lock()
 clients = {}                           # dicionário com informações de cada cliente conectado
 
+tournaments_lock = threading.Lock()
+tournaments = {}                       # torneios por id (estado em tournament.py)
+tournament_seq = 0
+tournament_wakeup = threading.Event()  # acorda o agendador quando uma partida de torneio termina
+TOURNAMENT_MAX_GAMES = int(os.environ.get("RPS_TOURNAMENT_MAX_GAMES", 256))   # partidas de torneio simultâneas
+tournament_games = 0                   # partidas de torneio em andamento (todos os torneios)
+
+games_lock = threading.Lock()
+games = {}                             # checkpoint de cada partida em andamento (match_id -> estado do turno)
+
+# Snapshot do estado para reinício a quente
+SNAPSHOT_PATH = os.environ.get("RPS_SNAPSHOT", "snapshot.bin")
+SNAPSHOT_INTERVAL = float(os.environ.get("RPS_SNAPSHOT_INTERVAL", 10))   # 0 desliga o snapshot periódico
+SNAPSHOT_VERSION = 1
+snapshot_lock = threading.Lock()       # um snapshot por vez (periódico e o final do SIGTERM)
+RESUME_GRACE = float(os.environ.get("RPS_RESUME_GRACE", 60))             # prazo (s) para retomar a sessão
+detached = {}                          # sessões restauradas aguardando "resume" (client_id -> estado), sob clients_lock
+resume_tokens = {}                     # token -> client_id das sessões em "detached"
+
+# Um lock de envio por socket: handler, entregas assíncronas e partida escrevem no mesmo socket
+send_locks = weakref.WeakKeyDictionary()
+send_locks_guard = threading.Lock()
+
 # Função para enviar mensagens em JSON pelo socket
 def send_json(sock, obj):
     data = json.dumps(obj).encode('utf-8')
-    sock.sendall(len(data).to_bytes(4,'big') + data)
+    with send_locks_guard:
+        lock = send_locks.get(sock)
+        if lock is None:
+            lock = send_locks[sock] = threading.Lock()
+    with lock:
+        sock.sendall(len(data).to_bytes(4,'big') + data)
 
 # Função para receber mensagens em JSON pelo socket
 def recv_json(sock):
@@ -67,6 +104,51 @@ def udp_server():
         data, addr = s.recvfrom(4096)
         s.sendto(data, addr)
 
+# Inicia uma partida entre dois clientes conectados; on_finish recebe o id do vencedor (None = empate)
+# Devolve False se um dos jogadores saiu ou já está em outra partida (ex.: de torneio)
+def start_game(a, b, on_finish=None, tag=None, resume=None):
+    with clients_lock:
+        if a not in clients or b not in clients:
+            return False
+        # Partida restaurada: o "resume" já marcou os jogadores como em jogo para reservá-los
+        if not resume and (clients[a]['in_game'] or clients[b]['in_game']):
+            return False
+        clients[a]['in_game'] = True
+        clients[b]['in_game'] = True
+        clients[a]['game_queue'] = Queue()
+        clients[b]['game_queue'] = Queue()
+
+    # Garante a limpeza e o aviso de fim mesmo se a sessão cair com erro de socket
+    def run():
+        done = []
+        def finish(winner):
+            done.append(winner)
+            if on_finish:
+                on_finish(winner)
+        try:
+            game_session(a, b, finish, tag, resume)
+        except Exception as e:
+            print("[GAME] session error", a, b, e)
+            with clients_lock:
+                present = [cid for cid in (a, b) if cid in clients]
+                for cid in present:
+                    clients[cid]['in_game'] = False
+                    clients[cid]['game_queue'] = None
+            # Fecha a partida no log e dá a vitória a quem continua conectado
+            winner = present[0] if len(present) == 1 else None
+            side = 'A' if winner == a else ('B' if winner == b else None)
+            reason = replay_log.REASON_DISCONNECT_B if side == 'A' else replay_log.REASON_DISCONNECT_A
+            with games_lock:
+                for mid, g in list(games.items()):
+                    if g["a"] == a and g["b"] == b:
+                        games.pop(mid)
+                        replay_log.record_end(mid, g["turn"] - 1, side, reason)
+            if not done:
+                finish(winner)
+
+    threading.Thread(target=run, daemon=True).start()
+    return True
+
 # Monitor de matchmaking: verifica a fila de jogadores e inicia partidas
 def matchmaking_watcher():
     while True:
@@ -77,51 +159,94 @@ def matchmaking_watcher():
             else:
                 a = b = None
         if a and b:
-            with clients_lock:
-                if a in clients and b in clients:
-                    clients[a]['in_game'] = True
-                    clients[b]['in_game'] = True
-                    clients[a]['game_queue'] = Queue()
-                    clients[b]['game_queue'] = Queue()
-                    threading.Thread(target=game_session, args=(a,b), daemon=True).start()
-                else:
-                    # Se um desconectou, devolve o outro para a fila
-                    if a in clients:
-                        with match_lock:
-                            match_queue.appendleft(a)
-                    if b in clients:
-                        with match_lock:
-                            match_queue.appendleft(b)
+            if not start_game(a, b):
+                with clients_lock:
+                    # Se um desconectou ou já entrou em outra partida (torneio), devolve o outro para a fila
+                    for cid in (b, a):
+                        if cid in clients and not clients[cid]['in_game']:
+                            with match_lock:
+                                match_queue.appendleft(cid)
+                        else:
+                            print(f"[MATCH] dropping {cid} from queue (disconnected or already in game)")
         else:
             time.sleep(0.1)
 
 # Lógica principal da sessão de jogo entre dois jogadores
-def game_session(cli_a, cli_b):
-    print(f"[GAME] starting game between {cli_a} and {cli_b}")
+# tag identifica a partida de torneio (tid, id da partida); resume é um checkpoint salvo em "games"
+def game_session(cli_a, cli_b, on_finish=None, tag=None, resume=None):
+    print(f"[GAME] {'resuming' if resume else 'starting'} game between {cli_a} and {cli_b}")
     with clients_lock:
         A = clients.get(cli_a)
         B = clients.get(cli_b)
+        for cl in (A, B):
+            if cl and not (A and B):
+                cl['in_game'] = False
+                cl['game_queue'] = None
     if not A or not B:
         print("[GAME] abort, client missing")
+        if resume:
+            with games_lock:
+                games.pop(resume["match_id"], None)
+        if on_finish:
+            on_finish(cli_a if A else (cli_b if B else None))
         return
     sock_a = A['sock']; sock_b = B['sock']
+    reason = replay_log.REASON_NORMAL
+    gone = []                          # jogador cujo socket caiu durante a partida
+
+    # Envia para um dos jogadores; se o socket dele caiu, anota quem saiu e propaga o erro
+    def send_to(client_id, obj):
+        try:
+            send_json(sock_a if client_id == cli_a else sock_b, obj)
+        except OSError:
+            gone.append(client_id)
+            raise
 
     # Função para gerar baralho aleatório de 10 cartas
     def make_deck():
         deck = []
         for _ in range(10):
-            deck.append(random.choice(["Pedra","Papel","Tesoura"]))
-        random.shuffle(deck)
+            deck.append(rng.choice(["Pedra","Papel","Tesoura"]))
+        rng.shuffle(deck)
         return deck
 
-    deck_a = make_deck()
-    deck_b = make_deck()
-    lives_a = 3; lives_b = 3
-    turn = 1
+    # Checkpoint no início de cada turno (chamado com games_lock): é o que o snapshot grava
+    def checkpoint():
+        games[match_id] = {"match_id": match_id, "a": cli_a, "b": cli_b, "tag": tag,
+                           "deck_a": list(deck_a), "deck_b": list(deck_b),
+                           "hand_a": list(hand_a), "hand_b": list(hand_b),
+                           "lives_a": lives_a, "lives_b": lives_b, "turn": turn,
+                           "rng": rng.getstate()}
+
+    if resume:
+        # Partida restaurada de um snapshot: continua do início do turno salvo, com o mesmo RNG
+        match_id = resume["match_id"]
+        rng = random.Random()
+        rng.setstate(resume["rng"])
+        deck_a = list(resume["deck_a"]); deck_b = list(resume["deck_b"])
+        hand_a = list(resume["hand_a"]); hand_b = list(resume["hand_b"])
+        lives_a = resume["lives_a"]; lives_b = resume["lives_b"]
+        turn = resume["turn"]
+        with games_lock:
+            checkpoint()
+    else:
+        # RNG próprio da partida: a semente fica no log e permite o replay exato
+        match_id = replay_log.new_match_id()
+        seed = random.getrandbits(64)
+        rng = random.Random(seed)
+
+        deck_a = make_deck()
+        deck_b = make_deck()
+        lives_a = 3; lives_b = 3
+        turn = 1
+
+        # Cada jogador começa com 3 cartas na mão
+        hand_a = [deck_a.pop() for _ in range(min(3,len(deck_a)))]
+        hand_b = [deck_b.pop() for _ in range(min(3,len(deck_b)))]
 
-    # Cada jogador começa com 3 cartas na mão
-    hand_a = [deck_a.pop() for _ in range(min(3,len(deck_a)))]
-    hand_b = [deck_b.pop() for _ in range(min(3,len(deck_b)))]
+        with games_lock:
+            replay_log.record_start(match_id, seed, cli_a, cli_b)
+            checkpoint()
 
     # Monta mão de exibição (usa skin equipada ou tipo padrão)
     def build_display_hand(client_id, hand_types):
@@ -145,130 +270,145 @@ def game_session(cli_a, cli_b):
                     return t
         return None
 
-    # Envia mensagem inicial de início de jogo
-    send_json(sock_a, {"cmd":"game_start","opponent":cli_b, "hand": build_display_hand(cli_a, hand_a), "lives":lives_a})
-    send_json(sock_b, {"cmd":"game_start","opponent":cli_a, "hand": build_display_hand(cli_b, hand_b), "lives":lives_b})
+    # Retira da mão a carta jogada; se inválida, escolhe fallback (aleatório da mão ou aleatório geral)
+    def take_card(hand, card_type):
+        if card_type:
+            try:
+                hand.remove(card_type)
+                return card_type, False
+            except ValueError:
+                pass
+        if hand:
+            return hand.pop(rng.randrange(len(hand))), True
+        return rng.choice(["Pedra","Papel","Tesoura"]), True
 
-    # Loop principal de turnos
-    while True:
-        if lives_a <= 0 or lives_b <= 0:
-            break
-        if not deck_a and not deck_b and not hand_a and not hand_b:
-            break
+    # Um erro de socket encerra a partida: quem saiu perde por W.O.
+    try:
+        # Envia mensagem inicial de início de jogo
+        send_to(cli_a, {"cmd":"game_start","opponent":cli_b, "hand": build_display_hand(cli_a, hand_a), "lives":lives_a, "resumed": bool(resume)})
+        send_to(cli_b, {"cmd":"game_start","opponent":cli_a, "hand": build_display_hand(cli_b, hand_b), "lives":lives_b, "resumed": bool(resume)})
 
-        tid = f"turn-{cli_a}-{cli_b}-{turn}-{int(time.time())}"
+        # Loop principal de turnos
+        while True:
+            if lives_a <= 0 or lives_b <= 0:
+                break
+            if not deck_a and not deck_b and not hand_a and not hand_b:
+                break
 
-        # Envia início de turno para os dois jogadores
-        send_json(sock_a, {"cmd":"turn_start","turn":turn, "hand": build_display_hand(cli_a, hand_a), "tid":tid})
-        send_json(sock_b, {"cmd":"turn_start","turn":turn, "hand": build_display_hand(cli_b, hand_b), "tid":tid})
+            tid = f"turn-{cli_a}-{cli_b}-{turn}-{int(time.time())}"
 
-        # Coleta jogada de cada jogador
-        try:
-            r1 = clients[cli_a]['game_queue'].get(timeout=25)
-        except Exception:
-            print("[GAME] timeout ou A desconectou")
-            send_json(sock_b, {"cmd":"opponent_disconnect"})
-            break
-        try:
-            r2 = clients[cli_b]['game_queue'].get(timeout=25)
-        except Exception:
-            print("[GAME] timeout ou B desconectou")
-            send_json(sock_a, {"cmd":"opponent_disconnect"})
-            break
+            # Envia início de turno para os dois jogadores
+            send_to(cli_a, {"cmd":"turn_start","turn":turn, "hand": build_display_hand(cli_a, hand_a), "tid":tid})
+            send_to(cli_b, {"cmd":"turn_start","turn":turn, "hand": build_display_hand(cli_b, hand_b), "tid":tid})
 
-        if not r1 or not r2:
-            print("[GAME] got empty play payload")
-            break
-        if r1.get("cmd") != "play" or r2.get("cmd") != "play":
-            print("[GAME] unexpected payloads", r1, r2)
-            break
+            # Coleta jogada de cada jogador
+            try:
+                r1 = clients[cli_a]['game_queue'].get(timeout=25)
+            except Exception:
+                print("[GAME] timeout ou A desconectou")
+                reason = replay_log.REASON_TIMEOUT_A
+                try:
+                    send_json(sock_b, {"cmd":"opponent_disconnect"})
+                except OSError:
+                    pass
+                break
+            try:
+                r2 = clients[cli_b]['game_queue'].get(timeout=25)
+            except Exception:
+                print("[GAME] timeout ou B desconectou")
+                reason = replay_log.REASON_TIMEOUT_B
+                try:
+                    send_json(sock_a, {"cmd":"opponent_disconnect"})
+                except OSError:
+                    pass
+                break
 
-        # Entrada dos jogadores
-        in_a = r1.get("card")
-        in_b = r2.get("card")
+            if not r1 or not r2:
+                print("[GAME] got empty play payload")
+                reason = replay_log.REASON_BAD_PAYLOAD
+                break
+            if r1.get("cmd") != "play" or r2.get("cmd") != "play":
+                print("[GAME] unexpected payloads", r1, r2)
+                reason = replay_log.REASON_BAD_PAYLOAD
+                break
 
-        # Resolve entrada para tipo
-        type_a = resolve_input_to_type(cli_a, in_a)
-        type_b = resolve_input_to_type(cli_b, in_b)
+            # Entrada dos jogadores
+            in_a = r1.get("card")
+            in_b = r2.get("card")
 
-        # Caso inválido: escolhe fallback (aleatório da mão ou aleatório geral)
-        if not type_a:
-            if hand_a:
-                idx = random.randrange(len(hand_a))
-                type_a = hand_a.pop(idx)
-            else:
-                type_a = random.choice(["Pedra","Papel","Tesoura"])
-        else:
-            try:
-                hand_a.remove(type_a)
-            except ValueError:
-                if hand_a:
-                    idx = random.randrange(len(hand_a))
-                    type_a = hand_a.pop(idx)
-                else:
-                    type_a = random.choice(["Pedra","Papel","Tesoura"])
+            # Resolve entrada para tipo
+            type_a = resolve_input_to_type(cli_a, in_a)
+            type_b = resolve_input_to_type(cli_b, in_b)
 
-        if not type_b:
-            if hand_b:
-                idx = random.randrange(len(hand_b))
-                type_b = hand_b.pop(idx)
-            else:
-                type_b = random.choice(["Pedra","Papel","Tesoura"])
-        else:
-            try:
-                hand_b.remove(type_b)
-            except ValueError:
-                if hand_b:
-                    idx = random.randrange(len(hand_b))
-                    type_b = hand_b.pop(idx)
+            # Caso inválido: escolhe fallback (aleatório da mão ou aleatório geral)
+            type_a, fb_a = take_card(hand_a, type_a)
+            type_b, fb_b = take_card(hand_b, type_b)
+
+            # Resolve vencedor
+            with clients_lock:
+                sk_a = clients.get(cli_a, {}).get('skins', {}).get(type_a, type_a)
+                sk_b = clients.get(cli_b, {}).get('skins', {}).get(type_b, type_b)
+
+            winner = None
+            if type_a != type_b:
+                if (type_a=="Pedra" and type_b=="Tesoura") or \
+                   (type_a=="Tesoura" and type_b=="Papel") or \
+                   (type_a=="Papel" and type_b=="Pedra"):
+                    winner = 'A'
+                    lives_b -= 1
                 else:
-                    type_b = random.choice(["Pedra","Papel","Tesoura"])
+                    winner = 'B'
+                    lives_a -= 1
 
-        # Resolve vencedor
-        with clients_lock:
-            sk_a = clients.get(cli_a, {}).get('skins', {}).get(type_a, type_a)
-            sk_b = clients.get(cli_b, {}).get('skins', {}).get(type_b, type_b)
-
-        winner = None
-        if type_a != type_b:
-            if (type_a=="Pedra" and type_b=="Tesoura") or \
-               (type_a=="Tesoura" and type_b=="Papel") or \
-               (type_a=="Papel" and type_b=="Pedra"):
-                winner = 'A'
-                lives_b -= 1
-            else:
-                winner = 'B'
-                lives_a -= 1
-
-        # Envia resultado do turno para ambos
-        resA = {"cmd":"turn_result","your_card": sk_a,"your_card_type": type_a,
-                "opp_card": sk_b,"opp_card_type": type_b,"winner": winner,
-                "your_lives": lives_a,"opp_lives": lives_b}
-        resB = {"cmd":"turn_result","your_card": sk_b,"your_card_type": type_b,
-                "opp_card": sk_a,"opp_card_type": type_a,
-                "winner": ('A' if winner=='B' else ('B' if winner=='A' else None)),
-                "your_lives": lives_b,"opp_lives": lives_a}
-        send_json(sock_a, resA)
-        send_json(sock_b, resB)
-
-        # Fase de compra de carta
-        if deck_a:
-            hand_a.append(deck_a.pop())
-        if deck_b:
-            hand_b.append(deck_b.pop())
-
-        turn += 1
-        time.sleep(0.05)
+            # Registro do turno, compra de carta e checkpoint do próximo turno são atômicos para o snapshot
+            with games_lock:
+                replay_log.record_turn(match_id, turn, type_a, type_b, fb_a, fb_b, winner, lives_a, lives_b)
+                if deck_a:
+                    hand_a.append(deck_a.pop())
+                if deck_b:
+                    hand_b.append(deck_b.pop())
+                turn += 1
+                checkpoint()
+
+            # Envia resultado do turno para ambos
+            resA = {"cmd":"turn_result","your_card": sk_a,"your_card_type": type_a,
+                    "opp_card": sk_b,"opp_card_type": type_b,"winner": winner,
+                    "your_lives": lives_a,"opp_lives": lives_b}
+            resB = {"cmd":"turn_result","your_card": sk_b,"your_card_type": type_b,
+                    "opp_card": sk_a,"opp_card_type": type_a,
+                    "winner": ('A' if winner=='B' else ('B' if winner=='A' else None)),
+                    "your_lives": lives_b,"opp_lives": lives_a}
+            send_to(cli_a, resA)
+            send_to(cli_b, resB)
+
+            time.sleep(0.05)
+    except OSError as e:
+        if not gone:
+            raise
+        print("[GAME] player left mid-game", gone[0], e)
+        reason = replay_log.REASON_DISCONNECT_A if gone[0] == cli_a else replay_log.REASON_DISCONNECT_B
+        try:
+            send_json(sock_b if gone[0] == cli_a else sock_a, {"cmd":"opponent_disconnect"})
+        except Exception:
+            pass
 
     # Define resultado final
-    if lives_a <= 0 and lives_b <= 0:
-        final = "tie"
+    if gone:
+        final_winner = 'B' if gone[0] == cli_a else 'A'
+        final = f"{cli_b if final_winner == 'B' else cli_a}_wins"
+    elif lives_a <= 0 and lives_b <= 0:
+        final = "tie"; final_winner = None
     elif lives_a <= 0:
-        final = f"{cli_b}_wins"
+        final = f"{cli_b}_wins"; final_winner = 'B'
     elif lives_b <= 0:
-        final = f"{cli_a}_wins"
+        final = f"{cli_a}_wins"; final_winner = 'A'
     else:
-        final = "tie"
+        final = "tie"; final_winner = None
+
+    # Fim no log antes do aviso aos jogadores: um snapshot no meio não "desfaz" o game_over
+    with games_lock:
+        games.pop(match_id, None)
+        replay_log.record_end(match_id, turn - 1, final_winner, reason)
 
     try:
         send_json(sock_a, {"cmd":"game_over","result":final})
@@ -290,15 +430,331 @@ def game_session(cli_a, cli_b):
             clients[cli_b]['in_game'] = False
             clients[cli_b]['game_queue'] = None
 
+    if on_finish:
+        on_finish(cli_a if final_winner == 'A' else (cli_b if final_winner == 'B' else None))
+
+# Envia as notificações geradas pelo torneio (eliminação, fim de rodada, fim do torneio)
+def tournament_notify(t, events):
+    for ev in events:
+        if ev[0] == "eliminated":
+            targets = [ev[1]]
+            obj = {"cmd":"tournament_eliminated","tid":t["id"]}
+        elif ev[0] == "round_done":
+            targets = [t["owner"]]
+            obj = {"cmd":"tournament_round","tid":t["id"],"round":ev[1],"duration":round(ev[2],3)}
+            print(f"[TOURNAMENT] {t['id']} round {ev[1]} done in {ev[2]:.3f}s")
+        else:
+            targets = list(t["players"])
+            if t["owner"] not in targets:
+                targets.append(t["owner"])
+            obj = {"cmd":"tournament_over","tid":t["id"],"champion":ev[1],"standings":ev[2],
+                   "games":t["games"],"duration":round(t["finished"] - t["started"],3),
+                   "round_durations":tournament.round_durations(t),
+                   "sched_time":round(t["sched_time"],6)}
+            print(f"[TOURNAMENT] {t['id']} finished, champion {ev[1]}")
+        with clients_lock:
+            socks = [clients[c]['sock'] for c in targets if c in clients]
+        for sock in socks:
+            try:
+                send_json(sock, obj)
+            except Exception:
+                pass
+
+# Resultado de uma partida de torneio (chamado pela game_session ao terminar)
+def tournament_result(t, m, winner):
+    global tournament_games
+    t0 = time.thread_time()
+    with tournaments_lock:
+        tournament_games -= 1
+        events = tournament.finish_match(t, m, winner)
+        t["sched_time"] += time.thread_time() - t0
+    tournament_notify(t, events)
+    tournament_wakeup.set()
+
+# Callback de fim de partida de torneio a partir da tag (tid, id da partida)
+def tournament_on_finish(tag):
+    if not tag:
+        return None
+    with tournaments_lock:
+        t = tournaments.get(tag[0])
+    if t is None:
+        return None
+    m = t["matches"][tag[1]]
+    return lambda w: tournament_result(t, m, w)
+
+# Despacha as partidas prontas cujos dois jogadores estão livres; as demais esperam a próxima passada.
+# Cada partida ocupa uma thread: acima de TOURNAMENT_MAX_GAMES simultâneas, as prontas aguardam uma vaga
+def tournament_dispatch(t):
+    global tournament_games
+    t0 = time.thread_time()
+    with tournaments_lock:
+        ready = tournament.pop_ready(t)
+    if not ready:
+        return
+    blocked = []; events = []; again = False
+    for i, m in enumerate(ready):
+        if tournament_games >= TOURNAMENT_MAX_GAMES:
+            blocked.extend(ready[i:])
+            break
+        a, b = m["a"], m["b"]
+        with clients_lock:
+            ca = clients.get(a); cb = clients.get(b)
+            busy = (ca is not None and ca['in_game']) or (cb is not None and cb['in_game'])
+            # Jogador restaurado de snapshot que ainda pode retomar a sessão: espera por ele
+            busy = busy or a in detached or b in detached
+        if busy:
+            blocked.append(m)
+        elif ca is None or cb is None:
+            # Jogador desconectado perde por W.O.
+            with tournaments_lock:
+                events += tournament.finish_match(t, m, a if ca else (b if cb else None), forfeit=True)
+            again = True
+        else:
+            with tournaments_lock:
+                tournament.mark_playing(t, m)
+                tournament_games += 1
+            if not start_game(a, b, on_finish=lambda w, t=t, m=m: tournament_result(t, m, w), tag=(t["id"], m["id"])):
+                with tournaments_lock:
+                    tournament.unmark_playing(t, m)
+                    tournament_games -= 1
+                blocked.append(m)
+    with tournaments_lock:
+        t["ready"].extendleft(reversed(blocked))
+        t["sched_time"] += time.thread_time() - t0
+    tournament_notify(t, events)
+    if again:
+        tournament_wakeup.set()
+
+# Agendador de torneios: acorda a cada partida encerrada (ou periodicamente) e despacha as prontas
+def tournament_scheduler():
+    while True:
+        tournament_wakeup.wait(0.5)
+        tournament_wakeup.clear()
+        with tournaments_lock:
+            running = [t for t in tournaments.values() if t["state"] == "running" and t["ready"]]
+        for t in running:
+            tournament_dispatch(t)
+
+# ---------------- Snapshot e reinício a quente ----------------
+
+# Estado do servidor em estruturas simples (sem sockets, filas ou eventos)
+def build_snapshot():
+    queued = set(match_queue)
+    owed = Counter(cid for cid, _ in package_queue)
+    sessions = {}
+    for cid, cl in clients.items():
+        sessions[cid] = {"token": cl["token"], "skins": cl["skins"], "packages": cl["packages"],
+                         "queued": cid in queued, "owed": owed[cid]}
+    sessions.update(detached)
+    return {"version": SNAPSHOT_VERSION, "time": time.time(), "package_stock": PACKAGE_STOCK,
+            "sessions": sessions, "games": games, "tournaments": tournaments,
+            "tournament_seq": tournament_seq}
+
+# Grava em um arquivo temporário próprio do processo e troca atomicamente pelo destino
+def _write_file(path, data):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except OSError:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+# Locks de todo o estado que vai para o snapshot, na ordem em que são tomados
+STATE_LOCKS = (clients_lock, match_lock, package_lock, tournaments_lock, games_lock)
+
+# Grava o snapshot. Com fork, os locks ficam presos só durante o fork: o processo filho
+# serializa a cópia copy-on-write do estado enquanto o servidor segue atendendo.
+# Sem fork (Windows), serializa sob os locks e grava o arquivo depois de soltá-los.
+# snapshot_lock fica preso até o arquivo estar gravado: o snapshot final do SIGTERM espera
+# o periódico em andamento terminar, e o periódico nunca sobrescreve o final com estado antigo.
+# Com hold=True os locks do estado não são soltos (desligamento): partidas e torneios param
+# exatamente no estado gravado.
+def write_snapshot(path=None, hold=False):
+    with snapshot_lock:
+        return _write_snapshot(path or SNAPSHOT_PATH, hold)
+
+def _write_snapshot(path, hold):
+    t0 = time.perf_counter()
+    use_fork = hasattr(os, "fork")
+    for lock in STATE_LOCKS:
+        lock.acquire()
+    try:
+        if use_fork:
+            pid = os.fork()
+            if pid == 0:
+                # Processo filho: só ele roda aqui, então não toca em locks, prints ou threads.
+                # Ignora SIGTERM (ex.: enviado ao grupo de processos) para terminar a gravação.
+                code = 1
+                try:
+                    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+                    _write_file(path, pickle.dumps(build_snapshot(), pickle.HIGHEST_PROTOCOL))
+                    code = 0
+                finally:
+                    os._exit(code)
+        else:
+            data = pickle.dumps(build_snapshot(), pickle.HIGHEST_PROTOCOL)
+    finally:
+        if not hold:
+            for lock in reversed(STATE_LOCKS):
+                lock.release()
+    pause = time.perf_counter() - t0
+    if use_fork:
+        _, status = os.waitpid(pid, 0)
+        ok = os.waitstatus_to_exitcode(status) == 0
+    else:
+        try:
+            _write_file(path, data)
+            ok = True
+        except OSError:
+            ok = False
+    total = time.perf_counter() - t0
+    if not ok:
+        print(f"[SNAPSHOT] failed to write {path}")
+        return None
+    return {"pause": pause, "total": total, "size": os.path.getsize(path)}
+
+# Carrega o snapshot na inicialização: sessões ficam em "detached" até o cliente mandar "resume"
+def load_snapshot(path=None):
+    global PACKAGE_STOCK, tournament_seq, tournament_games
+    path = path or SNAPSHOT_PATH
+    t0 = time.perf_counter()
+    try:
+        with open(path, 'rb') as f:
+            snap = pickle.load(f)
+    except FileNotFoundError:
+        return False
+    except Exception as e:
+        print(f"[SNAPSHOT] ignoring unreadable snapshot {path}: {e}")
+        return False
+    if snap.get("version") != SNAPSHOT_VERSION:
+        print(f"[SNAPSHOT] ignoring snapshot version {snap.get('version')}")
+        return False
+
+    PACKAGE_STOCK = snap["package_stock"]
+    for cid, st in snap["sessions"].items():
+        detached[cid] = st
+        resume_tokens[st["token"]] = cid
+    for g in snap["games"].values():
+        g["restored"] = True
+    games.update(snap["games"])
+    tournaments.update(snap["tournaments"])
+    tournament_seq = snap["tournament_seq"]
+
+    # Partida de torneio "em andamento" sem checkpoint (terminou durante o snapshot) volta a ser jogada.
+    # Partida "ready" fora da fila estava com o agendador (entre pop_ready e o despacho): volta à fila
+    tags = {g["tag"] for g in games.values() if g.get("tag")}
+    for t in tournaments.values():
+        queued = {m["id"] for m in t["ready"]}
+        for m in t["matches"]:
+            if m["state"] == "playing" and (t["id"], m["id"]) not in tags:
+                m["state"] = "ready"
+                t["ready"].append(m)
+            elif m["state"] == "ready" and m["id"] not in queued:
+                t["ready"].append(m)
+    tournament_games = len(tags)
+
+    threading.Thread(target=resume_reaper, args=(time.time() + RESUME_GRACE,), daemon=True).start()
+    print(f"[SNAPSHOT] restored {len(detached)} sessions, {len(games)} games, "
+          f"{len(tournaments)} tournaments, stock {PACKAGE_STOCK} "
+          f"in {(time.perf_counter() - t0) * 1000:.1f} ms (age {time.time() - snap['time']:.1f}s)")
+    return True
+
+# Inicia uma partida restaurada quando os dois jogadores já retomaram a sessão
+def resume_games(client_id):
+    with games_lock:
+        pending = [g for g in games.values() if g.get("restored") and client_id in (g["a"], g["b"])]
+    for g in pending:
+        with clients_lock:
+            ready = g["a"] in clients and g["b"] in clients
+        if not ready:
+            continue
+        with games_lock:
+            if not g.pop("restored", False):
+                continue
+        start_game(g["a"], g["b"], tournament_on_finish(g["tag"]), g["tag"], g)
+
+# Fim do prazo de retomada: sessões não retomadas são descartadas, pacotes devolvidos
+# ao estoque e partidas restauradas terminam com vitória de quem voltou
+def resume_reaper(deadline):
+    global PACKAGE_STOCK
+    time.sleep(max(0.0, deadline - time.time()))
+    with clients_lock:
+        expired = dict(detached)
+        detached.clear()
+        resume_tokens.clear()
+    refund = sum(st["owed"] for st in expired.values())
+    if refund:
+        with package_lock:
+            PACKAGE_STOCK += refund
+    # Remoção do checkpoint e END no log juntos, sob games_lock (como na game_session)
+    finished = []
+    with clients_lock, games_lock:
+        abandoned = [games.pop(mid) for mid, g in list(games.items()) if g.get("restored")]
+        for g in abandoned:
+            a, b = g["a"], g["b"]
+            present = [c for c in (a, b) if c in clients]
+            for c in present:
+                clients[c]['in_game'] = False
+                clients[c]['game_queue'] = None
+            winner = present[0] if len(present) == 1 else None
+            side = 'A' if winner == a else ('B' if winner == b else None)
+            reason = replay_log.REASON_TIMEOUT_B if side == 'A' else replay_log.REASON_TIMEOUT_A
+            replay_log.record_end(g["match_id"], g["turn"] - 1, side, reason)
+            finished.append((g, winner, [clients[c]['sock'] for c in present]))
+    for g, winner, socks in finished:
+        for sock in socks:
+            try:
+                send_json(sock, {"cmd":"opponent_disconnect"})
+                send_json(sock, {"cmd":"game_over","result":f"{winner}_wins" if winner else "tie"})
+            except Exception:
+                pass
+        on_finish = tournament_on_finish(g["tag"])
+        if on_finish:
+            on_finish(winner)
+    print(f"[SNAPSHOT] resume window closed: {len(expired)} sessions and {len(abandoned)} games dropped, {refund} packages refunded")
+    tournament_wakeup.set()
+
+# Snapshot periódico
+def snapshot_service():
+    while True:
+        time.sleep(SNAPSHOT_INTERVAL)
+        info = write_snapshot()
+        if info:
+            print(f"[SNAPSHOT] {info['size']} bytes, pause {info['pause'] * 1000:.1f} ms, total {info['total'] * 1000:.1f} ms")
+
+# SIGTERM (deploy): grava o snapshot final e o log de replay pendente antes de sair
+def shutdown(signum, frame):
+    # Um segundo SIGTERM reentraria aqui com os locks do snapshot presos: ignora os próximos
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    # Os locks do estado ficam presos até a saída: nenhum turno, fim de partida ou resultado de
+    # torneio acontece depois do snapshot. Como os registros do replay só entram na fila sob
+    # games_lock, o flush grava exatamente o que já estava na fila no momento do fork.
+    info = write_snapshot(hold=True)
+    replay_log.flush_pending()
+    if info:
+        print(f"[SNAPSHOT] final snapshot {info['size']} bytes, pause {info['pause'] * 1000:.1f} ms")
+    sys.exit(0)
+
 # Função para lidar com cada cliente conectado ao servidor TCP
 def handle_client(conn, addr):
     client_id = f"{addr[0]}:{addr[1]}"
     print("[TCP] new", client_id)
     inbox = Queue()
+    token = secrets.token_hex(16)      # token para retomar a sessão após um reinício do servidor
     with clients_lock:
-        clients[client_id] = {"sock":conn, "addr":addr, "skins":{}, "packages":[], "inbox": inbox, "game_queue": None, "in_game": False}
+        # Após um reinício, o endereço pode coincidir com o de uma sessão restaurada
+        if client_id in detached or client_id in clients:
+            client_id = f"{client_id}#{token[:6]}"
+        clients[client_id] = {"sock":conn, "addr":addr, "skins":{}, "packages":[], "inbox": inbox, "game_queue": None, "in_game": False, "token": token}
 
-    global PACKAGE_STOCK
+    global PACKAGE_STOCK, tournament_seq
 
     # Thread leitora: recebe mensagens e coloca na fila inbox
     def reader():
@@ -313,16 +769,55 @@ def handle_client(conn, addr):
 
     threading.Thread(target=reader, daemon=True).start()
 
+    # Responde ao cliente, ecoando o "rid" do pedido quando ele foi enviado
+    def reply(obj, rid):
+        if rid is not None:
+            obj["rid"] = rid
+        send_json(conn, obj)
+
+    # Aguarda a reserva do pacote ser processada e entrega as skins sorteadas
+    def deliver_package(event, rid):
+        event.wait()
+        awarded = []
+        for _ in range(3):
+            t = random.choice(["Pedra","Papel","Tesoura"])
+            s = random.choice(SKINS[t])
+            awarded.append({"type":t,"skin":s})
+        with clients_lock:
+            present = client_id in clients
+            if present:
+                clients[client_id]["packages"].extend(awarded)
+        if not present:
+            print(f"[PACKAGE] client {client_id} disconnected before award delivery")
+            return
+        # Envio fora do clients_lock: um cliente que não lê não trava as outras threads
+        try:
+            reply({"cmd":"package_opened","awarded":awarded}, rid)
+        except Exception:
+            pass
+
+    # Entregas assíncronas (com "rid") da conexão: uma única thread, criada no primeiro pedido,
+    # atende todas na ordem das reservas (a mesma em que o package_service as libera)
+    deliveries = Queue()
+    delivery_thread = None
+    def delivery_worker():
+        while True:
+            item = deliveries.get()
+            if item is None:
+                return
+            deliver_package(*item)
+
     try:
         while True:
             msg = inbox.get()
             if msg is None:
                 break
             cmd = msg.get("cmd")
+            rid = msg.get("rid")
             if cmd == "join_queue":
                 with match_lock:
                     match_queue.append(client_id)
-                send_json(conn, {"cmd":"queued"})
+                reply({"cmd":"queued"}, rid)
             elif cmd == "open_package":
                 event = threading.Event()
                 queued = False
@@ -333,71 +828,160 @@ def handle_client(conn, addr):
                         queued = True
                         print(f"[PACKAGE] reserved for {client_id}, remaining stock {PACKAGE_STOCK}")
                 if not queued:
-                    send_json(conn, {"cmd":"package_empty","reason":"no_stock"})
+                    reply({"cmd":"package_empty","reason":"no_stock"}, rid)
                     continue
-                event.wait()
-                awarded = []
-                for _ in range(3):
-                    t = random.choice(["Pedra","Papel","Tesoura"])
-                    s = random.choice(SKINS[t])
-                    awarded.append({"type":t,"skin":s})
-                with clients_lock:
-                    if client_id in clients:
-                        clients[client_id]["packages"].extend(awarded)
-                        try:
-                            send_json(conn, {"cmd":"package_opened","awarded":awarded})
-                        except Exception:
-                            pass
-                    else:
-                        print(f"[PACKAGE] client {client_id} disconnected before award delivery")
+                # Com "rid" o cliente casa a resposta sozinho: a entrega segue em paralelo
+                # e o handler continua atendendo os próximos comandos (resposta fora de ordem)
+                if rid is not None:
+                    if delivery_thread is None:
+                        delivery_thread = threading.Thread(target=delivery_worker, daemon=True)
+                        delivery_thread.start()
+                    deliveries.put((event, rid))
+                else:
+                    deliver_package(event, rid)
             elif cmd == "equip":
                 t = msg.get("type"); s = msg.get("skin")
                 with clients_lock:
                     if any(p['skin']==s for p in clients[client_id]["packages"]):
                         clients[client_id]["skins"][t] = s
-                        send_json(conn, {"cmd":"equip_ok","type":t,"skin":s})
+                        reply({"cmd":"equip_ok","type":t,"skin":s}, rid)
                     else:
-                        send_json(conn, {"cmd":"equip_fail","reason":"skin_not_owned"})
+                        reply({"cmd":"equip_fail","reason":"skin_not_owned"}, rid)
             elif cmd == "ping_check":
-                send_json(conn, {"cmd":"pong"})
+                reply({"cmd":"pong"}, rid)
+            elif cmd == "session":
+                reply({"cmd":"session","client_id":client_id,"token":token}, rid)
+            elif cmd == "resume":
+                # Reassume a identidade (id, skins, fila, partida) de uma sessão restaurada do snapshot
+                with clients_lock:
+                    old_id = resume_tokens.get(msg.get("token"))
+                    st = detached.pop(old_id, None) if old_id else None
+                    if st:
+                        resume_tokens.pop(st["token"], None)
+                        entry = clients.pop(client_id)
+                        entry.update(skins=st["skins"], packages=st["packages"], token=st["token"])
+                        clients[old_id] = entry
+                        client_id = old_id; token = st["token"]
+                if not st:
+                    reply({"cmd":"resume_fail","reason":"unknown_token"}, rid)
+                    continue
+                with games_lock:
+                    in_game = any(client_id in (g["a"], g["b"]) for g in games.values() if g.get("restored"))
+                if in_game:
+                    with clients_lock:
+                        clients[client_id]['in_game'] = True
+                if st["queued"]:
+                    with match_lock:
+                        match_queue.append(client_id)
+                print(f"[TCP] {conn.getpeername()} resumed session {client_id}")
+                reply({"cmd":"resumed","client_id":client_id,"in_game":in_game,"queued":st["queued"]}, rid)
+                # Pacotes reservados antes do reinício são entregues agora (o estoque já foi descontado)
+                for _ in range(st["owed"]):
+                    event = threading.Event()
+                    with package_lock:
+                        package_queue.append((client_id,event))
+                    if delivery_thread is None:
+                        delivery_thread = threading.Thread(target=delivery_worker, daemon=True)
+                        delivery_thread.start()
+                    deliveries.put((event, None))
+                if in_game:
+                    resume_games(client_id)
+            elif cmd == "create_tournament":
+                fmt = msg.get("format", tournament.SINGLE)
+                rounds = msg.get("rounds")
+                if fmt not in tournament.FORMATS or (rounds is not None and (not isinstance(rounds, int) or rounds < 1)):
+                    reply({"cmd":"tournament_fail","reason":"bad_format"}, rid)
+                    continue
+                with tournaments_lock:
+                    tournament_seq += 1
+                    tid = f"T{tournament_seq}"
+                    tournaments[tid] = tournament.new_tournament(tid, fmt, client_id, rounds)
+                print(f"[TOURNAMENT] {tid} created by {client_id} ({fmt})")
+                reply({"cmd":"tournament_created","tid":tid,"format":fmt}, rid)
+            elif cmd == "join_tournament":
+                tid = msg.get("tid")
+                with tournaments_lock:
+                    t = tournaments.get(tid)
+                    if t is None:
+                        fail = "not_found"
+                    elif t["state"] != "open":
+                        fail = "already_started"
+                    elif client_id in t["players"]:
+                        fail = "already_joined"
+                    else:
+                        fail = None
+                        t["players"].append(client_id)
+                        count = len(t["players"])
+                if fail:
+                    reply({"cmd":"tournament_fail","tid":tid,"reason":fail}, rid)
+                else:
+                    reply({"cmd":"tournament_joined","tid":tid,"players":count}, rid)
+            elif cmd == "start_tournament":
+                tid = msg.get("tid")
+                with clients_lock:
+                    connected = set(clients)
+                with tournaments_lock:
+                    t = tournaments.get(tid)
+                    if t is None:
+                        fail = "not_found"
+                    elif t["owner"] != client_id:
+                        fail = "not_owner"
+                    elif t["state"] != "open":
+                        fail = "already_started"
+                    else:
+                        # Quem desconectou antes do início sai da chave
+                        t["players"] = [c for c in t["players"] if c in connected]
+                        fail = "not_enough_players" if len(t["players"]) < 2 else None
+                    if not fail:
+                        events = tournament.begin(t)
+                if fail:
+                    reply({"cmd":"tournament_fail","tid":tid,"reason":fail}, rid)
+                    continue
+                print(f"[TOURNAMENT] {tid} started with {len(t['players'])} players, {t['rounds']} rounds")
+                reply({"cmd":"tournament_started","tid":tid,"players":len(t["players"]),"rounds":t["rounds"]}, rid)
+                tournament_notify(t, events)
+                tournament_wakeup.set()
             elif cmd == "list_skins":
                 with clients_lock:
-                    pkgs = clients[client_id]["packages"]
-                    eq = clients[client_id]["skins"]
-                send_json(conn, {"cmd":"skins_list","owned":pkgs,"equipped":eq})
+                    pkgs = list(clients[client_id]["packages"])
+                    eq = dict(clients[client_id]["skins"])
+                reply({"cmd":"skins_list","owned":pkgs,"equipped":eq}, rid)
             elif cmd == "play":
                 with clients_lock:
                     cl = clients.get(client_id)
                 if cl and cl.get("in_game") and cl.get("game_queue") is not None:
                     cl["game_queue"].put(msg)
                 else:
-                    send_json(conn, {"cmd":"unknown"})
+                    reply({"cmd":"unknown"}, rid)
             else:
-                send_json(conn, {"cmd":"unknown"})
+                reply({"cmd":"unknown"}, rid)
     except Exception as e:
         print("[TCP] client disconnected", client_id, e)
     finally:
-        refunded = 0
-        with package_lock:
-            if package_queue:
-                new_q = deque()
-                while package_queue:
-                    cid, ev = package_queue.popleft()
-                    if cid == client_id:
-                        refunded += 1
-                        try:
-                            ev.set()
-                        except Exception:
-                            pass
-                    else:
-                        new_q.append((cid, ev))
-                package_queue.extend(new_q)
-                if refunded:
-                    PACKAGE_STOCK += refunded
-                    print(f"[PACKAGE] refunded {refunded} packages from disconnected {client_id}, stock={PACKAGE_STOCK}")
-
+        # Remove o cliente antes de acordar as entregas pendentes: deliver_package não o encontra
+        # mais e descarta a reserva devolvida ao estoque, em vez de entregá-la também
+        refunded = []
         with clients_lock:
             clients.pop(client_id, None)
+            with package_lock:
+                if package_queue:
+                    new_q = deque()
+                    while package_queue:
+                        cid, ev = package_queue.popleft()
+                        if cid == client_id:
+                            refunded.append(ev)
+                        else:
+                            new_q.append((cid, ev))
+                    package_queue.extend(new_q)
+                    if refunded:
+                        PACKAGE_STOCK += len(refunded)
+                        print(f"[PACKAGE] refunded {len(refunded)} packages from disconnected {client_id}, stock={PACKAGE_STOCK}")
+        for ev in refunded:
+            try:
+                ev.set()
+            except Exception:
+                pass
+        deliveries.put(None)
         conn.close()
 
 # Worker para processar pedidos de pacotes
@@ -420,6 +1004,8 @@ def package_service():
 # Servidor TCP principal
 def tcp_server():
     s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    # Reinício a quente: conexões do processo anterior ficam em TIME_WAIT na mesma porta
+    s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
     s.bind((HOST, TCP_PORT))
     s.listen(128)
     print(f"[TCP] server listening {HOST}:{TCP_PORT}")
@@ -427,9 +1013,15 @@ def tcp_server():
         conn, addr = s.accept()
         threading.Thread(target=handle_client, args=(conn,addr), daemon=True).start()
 
-# Inicialização: cria threads auxiliares e inicia o servidor TCP
+# Inicialização: restaura o snapshot (se houver), cria threads auxiliares e inicia o servidor TCP
 if __name__ == "__main__":
+    load_snapshot()
+    signal.signal(signal.SIGTERM, shutdown)
     threading.Thread(target=udp_server, daemon=True).start()
     threading.Thread(target=matchmaking_watcher, daemon=True).start()
     threading.Thread(target=package_service, daemon=True).start()
+    threading.Thread(target=replay_log.replay_writer, daemon=True).start()
+    threading.Thread(target=tournament_scheduler, daemon=True).start()
+    if SNAPSHOT_INTERVAL > 0:
+        threading.Thread(target=snapshot_service, daemon=True).start()
     tcp_server()
@@ -0,0 +1,137 @@
+import os
+import random
+import secrets
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import server
+import tournament
+from server import send_json, recv_json
+
+SERVER_HOST = "127.0.0.1"
+
+# Preenche o estado do servidor (neste processo) com jogadores, partidas e um torneio sintéticos
+def build_state(num_players=10000, in_game_frac=0.5, queued_frac=0.1):
+    types = ["Pedra","Papel","Tesoura"]
+    ids = [f"10.0.{i // 250}.{i % 250}:{40000 + i}" for i in range(num_players)]
+    for cid in ids:
+        packages = [{"type": t, "skin": random.choice(server.SKINS[t])}
+                    for t in (random.choice(types) for _ in range(3 * random.randint(0, 3)))]
+        skins = {p["type"]: p["skin"] for p in packages[:2]}
+        server.clients[cid] = {"sock": None, "addr": None, "skins": skins, "packages": packages,
+                               "inbox": None, "game_queue": None, "in_game": False,
+                               "token": secrets.token_hex(16)}
+
+    # Metade dos jogadores em partida, com checkpoint de turno (inclui o estado do RNG)
+    playing = ids[:int(num_players * in_game_frac)]
+    for i in range(0, len(playing) - 1, 2):
+        a, b = playing[i], playing[i + 1]
+        rng = random.Random(i)
+        deck_a = [rng.choice(types) for _ in range(7)]
+        deck_b = [rng.choice(types) for _ in range(7)]
+        mid = 1_000_000 + i
+        server.games[mid] = {"match_id": mid, "a": a, "b": b, "tag": None,
+                             "deck_a": deck_a, "deck_b": deck_b,
+                             "hand_a": [rng.choice(types) for _ in range(3)],
+                             "hand_b": [rng.choice(types) for _ in range(3)],
+                             "lives_a": 3, "lives_b": 2, "turn": 3, "rng": rng.getstate()}
+        server.clients[a]["in_game"] = server.clients[b]["in_game"] = True
+
+    for cid in ids[-int(num_players * queued_frac):]:
+        server.match_queue.append(cid)
+
+    # Torneio de 1024 jogadores recém-iniciado
+    t = tournament.new_tournament("T1", tournament.SINGLE, ids[-1])
+    t["players"] = ids[len(playing):len(playing) + 1024]
+    tournament.begin(t)
+    server.tournaments["T1"] = t
+    server.tournament_seq = 1
+    return ids
+
+# Espera o servidor aceitar conexões e retomar uma sessão; devolve o tempo até isso.
+# Com keep, a conexão fica aberta (guardada na lista) em vez de ser fechada
+def wait_serving(t0, token, timeout=30, keep=None):
+    while time.perf_counter() - t0 < timeout:
+        try:
+            s = socket.create_connection((SERVER_HOST, server.TCP_PORT), timeout=1)
+        except OSError:
+            time.sleep(0.005)
+            continue
+        try:
+            send_json(s, {"cmd":"resume","token":token,"rid":1})
+            resp = recv_json(s)
+            return time.perf_counter() - t0, resp
+        except OSError:
+            s.close()
+            s = None
+        finally:
+            if s is not None:
+                if keep is None:
+                    s.close()
+                else:
+                    keep.append(s)
+    return None, None
+
+def spawn_server(env):
+    return subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "server.py")],
+                            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+def snapshot_benchmark(num_players=10000, repeats=5, held_conns=32):
+    print(f"Montando estado sintético com {num_players} jogadores...")
+    ids = build_state(num_players)
+    tmp = tempfile.mkdtemp(prefix="rps_snap_")
+    path = os.path.join(tmp, "snapshot.bin")
+
+    # 1. Custo do snapshot: pausa das threads do servidor (locks presos) e tempo total
+    runs = [server.write_snapshot(path) for _ in range(repeats)]
+    pause = sorted(r["pause"] for r in runs)[repeats // 2]
+    total = sorted(r["total"] for r in runs)[repeats // 2]
+    print(f"Snapshot: {runs[0]['size'] / 1024:.0f} KiB | pausa (mediana) {pause * 1000:.1f} ms | "
+          f"total {total * 1000:.1f} ms | {len(server.games)} partidas")
+
+    # 2. Reinício a quente: SIGTERM no servidor antigo (snapshot final) e subida do novo até atender um "resume"
+    env = dict(os.environ, RPS_SNAPSHOT=path, RPS_SNAPSHOT_INTERVAL="0",
+               RPS_REPLAY_DIR=os.path.join(tmp, "replays"))
+    # Clientes continuam conectados durante o reinício, como num deploy real: o servidor antigo
+    # fecha as conexões ao sair e a porta fica com conexões em TIME_WAIT
+    held = []
+    old = spawn_server(env)
+    for cid in ids[-held_conns:]:
+        if wait_serving(time.perf_counter(), server.clients[cid]["token"], keep=held)[0] is None:
+            print("Servidor não subiu")
+            old.kill()
+            return
+    token = server.clients[ids[-held_conns - 1]]["token"]   # os últimos já foram retomados pelo servidor antigo
+
+    t0 = time.perf_counter()
+    old.send_signal(signal.SIGTERM)
+    old.wait()
+    t_stop = time.perf_counter() - t0
+    new = spawn_server(env)
+    t_total, resp = wait_serving(t0, token)
+    for s in held:
+        s.close()
+    if t_total is None:
+        print(f"Servidor novo não subiu após o reinício (saída {new.poll()})")
+        new.kill()
+        return
+    print(f"Reinício ({len(held)} conexões abertas): parada com snapshot final {t_stop * 1000:.0f} ms | "
+          f"parada→servindo {t_total * 1000:.0f} ms | resposta: {resp.get('cmd')}")
+    new.send_signal(signal.SIGTERM)
+    new.wait()
+
+    # 3. Partida a frio (sem snapshot), para comparação
+    cold_env = dict(env, RPS_SNAPSHOT=os.path.join(tmp, "inexistente.bin"))
+    t0 = time.perf_counter()
+    cold = spawn_server(cold_env)
+    t_cold, _ = wait_serving(t0, "x")
+    print(f"Partida a frio (sem estado): {t_cold * 1000:.0f} ms até atender")
+    cold.kill()
+    cold.wait()
+
+if __name__ == "__main__":
+    snapshot_benchmark(int(sys.argv[1]) if len(sys.argv) >= 2 else 10000)
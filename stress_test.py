@@ -2,6 +2,7 @@ import socket
 import json
 import threading
 import time
+import sys
 
 SERVER_HOST = "127.0.0.1"   # ou "server" no Docker
 TCP_PORT = 9000
@@ -57,5 +58,73 @@ def stress_test(num_clients=50):
     if errors:
         print("Exemplos de erros:", errors[:3])
 
+# Cliente com até "depth" pedidos em voo na mesma conexão, casando respostas pelo "rid"
+# Carga "rapidos": só list_skins/ping_check; carga "misto": a cada 5 pedidos um open_package (lento)
+def pipelined_worker(i, results, num_requests, depth, workload):
+    try:
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        s.connect((SERVER_HOST, TCP_PORT))
+        pending = set()
+        replies = {}
+        sent = 0
+        t0 = time.time()
+        while len(replies) < num_requests:
+            while sent < num_requests and len(pending) < depth:
+                if workload == "misto" and sent % 5 == 0:
+                    cmd = "open_package"
+                else:
+                    cmd = "list_skins" if sent % 2 else "ping_check"
+                send_json(s, {"cmd":cmd, "rid":sent})
+                pending.add(sent)
+                sent += 1
+            resp = recv_json(s)
+            rid = resp.get("rid")
+            if rid in pending:
+                pending.discard(rid)
+                replies[rid] = resp.get("cmd")
+        elapsed = time.time() - t0
+        s.close()
+        results[i] = {"elapsed": elapsed, "replies": list(replies.values())}
+    except Exception as e:
+        results[i] = {"error": str(e)}
+
+# Benchmark: vazão por conexão (pedidos / tempo até a última resposta) com 1 pedido em voo
+# (sequencial) vs. vários (pipelined), em duas cargas:
+#   rapidos: nenhum pedido passa pelo package_service; mede o ganho de não esperar cada resposta
+#   misto:   1 em 5 é open_package; o package_service libera um pacote a cada 0.2s para o servidor
+#            todo, então a vazão total fica presa a ele e o pipeline praticamente não muda o total
+# Rode o servidor com estoque grande para que os open_package não recebam "package_empty":
+#   RPS_PACKAGE_STOCK=100000 python server.py
+def pipeline_benchmark(num_clients=10, num_requests=50, depths=(1, 4, 16)):
+    for workload, reqs in (("rapidos", num_requests * 20), ("misto", num_requests)):
+        print(f"Carga {workload}: {num_clients} conexões x {reqs} pedidos")
+        base = None
+        for depth in depths:
+            threads = []
+            results = {}
+            for i in range(num_clients):
+                t = threading.Thread(target=pipelined_worker, args=(i, results, reqs, depth, workload))
+                t.start()
+                threads.append(t)
+            for t in threads:
+                t.join()
+
+            ok = [r for r in results.values() if "error" not in r]
+            errors = [r for r in results.values() if "error" in r]
+            if not ok:
+                print(f"  depth={depth}: todos os clientes falharam", errors[:3])
+                continue
+            per_conn = sum(reqs / r["elapsed"] for r in ok) / len(ok)
+            empty = sum(r["replies"].count("package_empty") for r in ok)
+            if base is None:
+                base = per_conn
+            print(f"  depth={depth:3d}: {per_conn:8.1f} req/s por conexão (ganho {per_conn / base:5.2f}x) | "
+                  f"package_empty={empty}, erros={len(errors)}")
+
 if __name__ == "__main__":
-    stress_test(50)  # tenta 50 clientes em paralelo
+    if len(sys.argv) >= 2 and sys.argv[1] == "pipeline":
+        conns = int(sys.argv[2]) if len(sys.argv) >= 3 else 10
+        reqs = int(sys.argv[3]) if len(sys.argv) >= 4 else 50
+        pipeline_benchmark(conns, reqs)
+    else:
+        stress_test(50)  # tenta 50 clientes em paralelo
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+import math
+import time
+from collections import deque
+
+# Formatos de torneio
+SINGLE = "single"                      # eliminação simples
+SWISS = "swiss"                        # sistema suíço
+FORMATS = (SINGLE, SWISS)
+
+MAX_REMATCHES = 3                      # empates seguidos na eliminação antes de decidir pela semente
+WIN_POINTS, TIE_POINTS = 2, 1          # pontuação do suíço em meios pontos (vitória=1, empate=0.5)
+
+# O estado do torneio é um dicionário (como "clients" no servidor); as funções abaixo
+# atualizam o estado e devolvem eventos para o servidor notificar os jogadores:
+#   ("eliminated", cid), ("round_done", rodada, duração), ("over", campeão, classificação)
+
+# Cria um torneio ainda aberto para inscrições
+def new_tournament(tid, fmt, owner, rounds=None):
+    return {"id": tid, "format": fmt, "owner": owner, "players": [], "state": "open",
+            "rounds": rounds, "matches": [], "ready": deque(), "seed": {},
+            "scores": {}, "opponents": {}, "played": {}, "byes": set(), "waiting": {},
+            "round_left": {}, "round_start": {}, "round_end": {}, "champion": None,
+            "started": None, "finished": None, "games": 0, "sched_time": 0.0}
+
+# Ordem padrão das sementes no chaveamento (1 enfrenta o último, 2 o penúltimo...)
+def seed_positions(size):
+    order = [1]
+    while len(order) < size:
+        n = len(order) * 2
+        order = [x for s in order for x in (s, n + 1 - s)]
+    return order
+
+# Cria uma partida do torneio
+def _new_match(t, rnd, a=None, b=None, nxt=None):
+    m = {"id": len(t["matches"]), "round": rnd, "a": a, "b": b, "next": nxt,
+         "filled": 0, "state": "waiting", "winner": None, "rematches": 0}
+    t["matches"].append(m)
+    return m
+
+# Fecha as inscrições e monta o chaveamento; devolve os eventos gerados (byes, W.O.)
+def begin(t):
+    players = t["players"]
+    t["state"] = "running"
+    t["started"] = time.time()
+    t["seed"] = {cid: i + 1 for i, cid in enumerate(players)}
+    if t["format"] == SINGLE:
+        return _begin_single(t)
+    return _begin_swiss(t)
+
+# Partidas prontas (dois jogadores definidos) ainda não despachadas
+def pop_ready(t):
+    ready = list(t["ready"])
+    t["ready"].clear()
+    return ready
+
+# Marca a partida como em andamento (inicia o cronômetro da rodada)
+def mark_playing(t, m):
+    m["state"] = "playing"
+    t["games"] += 1
+    t["round_start"].setdefault(m["round"], time.time())
+
+# Desfaz mark_playing quando a partida não chegou a começar (volta a ser despachável)
+def unmark_playing(t, m):
+    m["state"] = "ready"
+    t["games"] -= 1
+
+# Registra o resultado de uma partida: winner é o id do vencedor ou None para "tie"
+def finish_match(t, m, winner, forfeit=False):
+    if t["format"] == SINGLE:
+        return _finish_single(t, m, winner, forfeit)
+    return _finish_swiss(t, m, winner)
+
+# Encerra uma rodada quando não restam partidas nela
+def _round_progress(t, rnd, amount, events):
+    t["round_left"][rnd] -= amount
+    if t["round_left"][rnd] == 0:
+        now = time.time()
+        t["round_start"].setdefault(rnd, now)
+        t["round_end"][rnd] = now
+        events.append(("round_done", rnd, now - t["round_start"][rnd]))
+        return True
+    return False
+
+# Duração de cada rodada, na ordem
+def round_durations(t):
+    return [round(t["round_end"][r] - t["round_start"][r], 3) for r in sorted(t["round_end"])]
+
+def _finish_tournament(t, champion, standings, events):
+    t["state"] = "finished"
+    t["finished"] = time.time()
+    t["champion"] = champion
+    events.append(("over", champion, standings))
+
+# ---------------- Eliminação simples ----------------
+
+def _begin_single(t):
+    players = t["players"]
+    size = 2
+    while size < len(players):
+        size *= 2
+    t["rounds"] = int(math.log2(size))
+    slots = [players[s - 1] if s <= len(players) else None for s in seed_positions(size)]
+
+    # Partidas da rodada 1 ocupam os primeiros índices, as da rodada 2 vêm em seguida e assim por diante
+    offset, count, rnd = 0, size // 2, 1
+    while count >= 1:
+        t["round_left"][rnd] = count
+        for i in range(count):
+            nxt = (offset + count + i // 2, i % 2) if count > 1 else None
+            if rnd == 1:
+                m = _new_match(t, rnd, slots[2 * i], slots[2 * i + 1], nxt)
+                m["filled"] = 2
+            else:
+                _new_match(t, rnd, nxt=nxt)
+        offset += count
+        count //= 2
+        rnd += 1
+
+    events = []
+    for m in t["matches"][:size // 2]:
+        _single_ready(t, m, events)
+    return events
+
+# Partida com os dois lados definidos: vai para a fila de prontas ou é decidida por W.O. (bye)
+def _single_ready(t, m, events):
+    if m["a"] is not None and m["b"] is not None:
+        m["state"] = "ready"
+        t["ready"].append(m)
+    else:
+        _finish_single(t, m, m["a"] if m["a"] is not None else m["b"], True, events)
+
+def _finish_single(t, m, winner, forfeit, events=None):
+    events = [] if events is None else events
+    a, b = m["a"], m["b"]
+    if winner is None and not forfeit and a is not None and b is not None:
+        # Empate: revanche, até MAX_REMATCHES; depois avança a melhor semente
+        if m["rematches"] < MAX_REMATCHES:
+            m["rematches"] += 1
+            m["state"] = "ready"
+            t["ready"].append(m)
+            return events
+        winner = a if t["seed"][a] < t["seed"][b] else b
+    m["state"] = "done"
+    m["winner"] = winner
+    for cid in (a, b):
+        if cid is not None and cid != winner:
+            events.append(("eliminated", cid))
+    _round_progress(t, m["round"], 1, events)
+
+    if m["next"] is None:
+        _finish_tournament(t, winner, [winner] if winner is not None else [], events)
+        return events
+    idx, slot = m["next"]
+    nxt = t["matches"][idx]
+    nxt["a" if slot == 0 else "b"] = winner
+    nxt["filled"] += 1
+    if nxt["filled"] == 2:
+        _single_ready(t, nxt, events)
+    return events
+
+# ---------------- Sistema suíço ----------------
+
+def _begin_swiss(t):
+    players = t["players"]
+    if not t["rounds"]:
+        t["rounds"] = max(1, math.ceil(math.log2(len(players))))
+    for cid in players:
+        t["scores"][cid] = 0
+        t["opponents"][cid] = set()
+        t["played"][cid] = 0
+    for rnd in range(1, t["rounds"] + 1):
+        t["round_left"][rnd] = len(players)
+        t["waiting"][rnd] = []
+    t["waiting"][1] = list(players)
+    events = []
+    _swiss_pair(t, 1, events)
+    return events
+
+# Cada jogador conta uma vez por rodada: a rodada acaba quando todos jogaram (ou tiveram bye)
+def _swiss_done_game(t, cid, events):
+    rnd = t["played"][cid] + 1
+    t["played"][cid] = rnd
+    if rnd < t["rounds"]:
+        t["waiting"][rnd + 1].append(cid)
+    if _round_progress(t, rnd, 1, events):
+        if rnd == t["rounds"]:
+            standings = swiss_standings(t)
+            _finish_tournament(t, standings[0][0] if standings else None, standings[:8], events)
+            return
+        _swiss_pair(t, rnd + 1, events)
+        return
+    if rnd < t["rounds"]:
+        _swiss_pair(t, rnd + 1, events)
+
+def _finish_swiss(t, m, winner):
+    events = []
+    m["state"] = "done"
+    m["winner"] = winner
+    a, b = m["a"], m["b"]
+    if winner is None:
+        t["scores"][a] += TIE_POINTS
+        t["scores"][b] += TIE_POINTS
+    else:
+        t["scores"][winner] += WIN_POINTS
+    _swiss_done_game(t, a, events)
+    _swiss_done_game(t, b, events)
+    return events
+
+# Emparelha quem está esperando a rodada rnd. Antes do fim da rodada anterior só junta jogadores
+# com a mesma pontuação que ainda não se enfrentaram; depois que ela termina, emparelha todos
+# os restantes por pontuação (com número ímpar, um deles recebe bye)
+def _swiss_pair(t, rnd, events):
+    waiting = t["waiting"][rnd]
+    barrier = rnd == 1 or t["round_left"][rnd - 1] == 0
+    if len(waiting) < 2 and not (barrier and waiting):
+        return
+    scores, seed = t["scores"], t["seed"]
+    waiting.sort(key=lambda c: (-scores[c], seed[c]))
+    bye = None
+    if barrier and len(waiting) % 2 == 1:
+        # Bye para o pior colocado que ainda não recebeu um
+        idx = next((i for i in range(len(waiting) - 1, -1, -1) if waiting[i] not in t["byes"]),
+                   len(waiting) - 1)
+        bye = waiting.pop(idx)
+    left = []
+    while waiting:
+        p = waiting.pop(0)
+        pick = None
+        for i, q in enumerate(waiting):
+            if q in t["opponents"][p]:
+                continue
+            if scores[q] == scores[p] or barrier:
+                pick = i
+                break
+        if pick is None and barrier and waiting:
+            pick = 0                   # só restam revanches: aceita
+        if pick is None:
+            left.append(p)
+            continue
+        q = waiting.pop(pick)
+        t["opponents"][p].add(q)
+        t["opponents"][q].add(p)
+        m = _new_match(t, rnd, p, q)
+        m["state"] = "ready"
+        t["ready"].append(m)
+    t["waiting"][rnd] = left
+    if bye is not None:
+        # O bye ganha os pontos da vitória sem jogar
+        t["byes"].add(bye)
+        t["scores"][bye] += WIN_POINTS
+        _swiss_done_game(t, bye, events)
+
+# Classificação do suíço: [(cid, pontos)] por pontuação e semente
+def swiss_standings(t):
+    order = sorted(t["players"], key=lambda c: (-t["scores"][c], t["seed"][c]))
+    return [(cid, t["scores"][cid] / 2) for cid in order]
@@ -0,0 +1,119 @@
+import socket
+import json
+import random
+import selectors
+import sys
+import time
+
+SERVER_HOST = "127.0.0.1"   # ou "server" no Docker
+TCP_PORT = 9000
+
+def send_json(sock, obj):
+    data = json.dumps(obj).encode('utf-8')
+    sock.sendall(len(data).to_bytes(4,'big') + data)
+
+def recv_json(sock):
+    header = sock.recv(4)
+    if not header:
+        raise ConnectionError("closed")
+    size = int.from_bytes(header,'big')
+    data = b''
+    while len(data) < size:
+        part = sock.recv(size - len(data))
+        if not part:
+            raise ConnectionError("closed")
+        data += part
+    return json.loads(data.decode('utf-8'))
+
+# Extrai as mensagens completas já recebidas no buffer de um cliente simulado
+def drain_frames(buf):
+    msgs = []
+    while len(buf) >= 4:
+        size = int.from_bytes(buf[:4], 'big')
+        if len(buf) < 4 + size:
+            break
+        msgs.append(json.loads(bytes(buf[4:4 + size]).decode('utf-8')))
+        del buf[:4 + size]
+    return msgs
+
+# Benchmark de torneio: um organizador cria o torneio e N clientes simulados se inscrevem
+# e jogam todas as partidas (respondem cada turno na hora). Um único thread atende todos
+# os clientes via selectors, para que o custo medido seja o do servidor.
+def tournament_benchmark(entrants=4096, fmt="single"):
+    owner = socket.create_connection((SERVER_HOST, TCP_PORT))
+    send_json(owner, {"cmd":"create_tournament","format":fmt,"rid":0})
+    resp = recv_json(owner)
+    if resp.get("cmd") != "tournament_created":
+        print("Falha ao criar torneio:", resp)
+        return
+    tid = resp["tid"]
+
+    t0 = time.time()
+    bots = []
+    for i in range(entrants):
+        s = socket.create_connection((SERVER_HOST, TCP_PORT))
+        send_json(s, {"cmd":"join_tournament","tid":tid,"rid":i})
+        bots.append(s)
+    joined = 0
+    for s in bots:
+        if recv_json(s).get("cmd") == "tournament_joined":
+            joined += 1
+    print(f"{joined}/{entrants} clientes inscritos em {tid} ({time.time() - t0:.1f}s)")
+
+    sel = selectors.DefaultSelector()
+    for s in bots:
+        sel.register(s, selectors.EVENT_READ, bytearray())
+    sel.register(owner, selectors.EVENT_READ, bytearray())
+
+    t_start = time.time()
+    send_json(owner, {"cmd":"start_tournament","tid":tid,"rid":1})
+    turns = 0; over = None
+    while over is None:
+        for key, _ in sel.select(timeout=60):
+            sock, buf = key.fileobj, key.data
+            try:
+                data = sock.recv(65536)
+            except OSError:
+                data = b''
+            if not data:
+                sel.unregister(sock)
+                continue
+            buf.extend(data)
+            for msg in drain_frames(buf):
+                cmd = msg.get("cmd")
+                if sock is owner:
+                    if cmd == "tournament_started":
+                        print(f"Torneio iniciado: {msg['players']} jogadores, {msg['rounds']} rodadas")
+                    elif cmd == "tournament_round":
+                        print(f"  rodada {msg['round']:2d} concluída em {msg['duration']:.3f}s "
+                              f"(t={time.time() - t_start:.2f}s)")
+                    elif cmd == "tournament_over":
+                        over = msg
+                    elif cmd == "tournament_fail":
+                        print("Falha ao iniciar torneio:", msg)
+                        return
+                elif cmd == "turn_start":
+                    hand = msg.get("hand") or ["Pedra"]
+                    send_json(sock, {"cmd":"play","card":random.choice(hand)})
+                    turns += 1
+        if not sel.get_map():
+            break
+
+    elapsed = time.time() - t_start
+    if over is None:
+        print("Conexões encerradas antes do fim do torneio")
+        return
+    n_games = over["games"]
+    print(f"Campeão: {over['champion']}")
+    print(f"Partidas: {n_games} | turnos jogados: {turns} | tempo total: {elapsed:.2f}s")
+    print(f"Rodadas (s): {over['round_durations']}")
+    print(f"Overhead do agendador (CPU): {over['sched_time'] * 1000:.1f} ms no total, "
+          f"{over['sched_time'] * 1e6 / max(n_games, 1):.1f} µs por partida")
+    for s in bots:
+        s.close()
+    owner.close()
+
+if __name__ == "__main__":
+    entrants = int(sys.argv[1]) if len(sys.argv) >= 2 else 4096
+    fmt = sys.argv[2] if len(sys.argv) >= 3 else "single"
+    tournament_benchmark(entrants, fmt)